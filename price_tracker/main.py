@@ -1,15 +1,31 @@
 import os
 import re
 import json
+import math
+import signal
+import random
 import asyncio
 from datetime import datetime, timezone
 from pathlib import Path
 
-from playwright.async_api import async_playwright
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import ssl
+import httpx
+
+# playwright, aiosmtplib and email.mime are imported lazily inside the
+# functions that need them: the browser only loads when the httpx fast-path
+# misses, and the email stack only when a message is actually sent.
+
+try:
+    import orjson
+
+    def _dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+
+    _loads = orjson.loads
+except ImportError:  # stdlib fallback keeps the tracker runnable without orjson
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+    _loads = json.loads
 
 # -------- CONFIG VIA ENV --------
 DATES = os.getenv("DATES", "2025-09-01,2025-09-02").split(",")
@@ -23,74 +39,272 @@ SMTP_USER = os.getenv("SMTP_USER", "")
 SMTP_PASS = os.getenv("SMTP_PASS", "")
 SMTP_SECURE = os.getenv("SMTP_SECURE", "TLS").upper()  # TLS | SSL | NONE
 EMAIL_ENABLED = os.getenv("EMAIL_ENABLED", "true").lower() in ("1", "true", "yes")
-HISTORY_PATH = Path(os.getenv("HISTORY_PATH", "data/history.json"))
+CONCURRENCY = int(os.getenv("CONCURRENCY", "6"))
+RUN_INTERVAL = int(os.getenv("RUN_INTERVAL_SECONDS", "3600"))
+RUN_ONCE = os.getenv("RUN_ONCE", "false").lower() in ("1", "true", "yes")  # cron/Actions mode
+HISTORY_PATH = Path(os.getenv("HISTORY_PATH", "data/history.jsonl"))
+BEST_PATH = Path(os.getenv("BEST_PATH", "data/best.json"))
 PEOPLE_SUMMARY = os.getenv("PEOPLE_SUMMARY", "2 adults")
 USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125 Safari/537.36"
 
-# Regex for proper currency amounts (requires symbol, avoids lone "1")
-PRICE_RE = re.compile(r"(?:A\$|AU\$|\$|¥|CNY)\s*([1-9]\d(?:,\d{3})*|\d{3,})(?:\.\d{1,2})?")
+# Targets never change for the life of the process (all env-derived), so
+# assemble them once at import instead of on every scheduled run.
+DATE_LIST = tuple(d.strip() for d in DATES if d.strip())
+
+def _format(url: str, d: str) -> str:
+    return url.replace("{DATE}", d)
+
+TARGETS = tuple(
+    (vendor, d, _format(u, d))
+    for d in DATE_LIST
+    for vendor, u in (("KLOOK", KLOOK_URL), ("TRIPCOM", TRIPCOM_URL))
+    if u
+)
+
+# Regex for proper currency amounts (requires symbol, avoids lone "1").
+# Explicit ASCII digit classes match faster on big HTML, but the gap between
+# symbol and amount must still admit NBSP — vendors render "¥\xa0479".
+PRICE_RE = re.compile(r"(?:A\$|AU\$|\$|¥|CNY)[ \t\xa0]*([1-9][0-9](?:,[0-9]{3})*|[0-9]{3,})(?:\.[0-9]{1,2})?")
+_finditer = PRICE_RE.finditer
+
+# Amount-only regex, anchored right after a currency token found by the
+# Aho-Corasick scan below.
+_AMOUNT_RE = re.compile(r"[ \t\xa0]*([1-9][0-9](?:,[0-9]{3})*|[0-9]{3,})")
+
+try:
+    import ahocorasick
+
+    _AUTOMATON = ahocorasick.Automaton()
+    for _tok in ("¥", "$", "A$", "AU$", "CNY"):
+        _AUTOMATON.add_word(_tok, _tok)
+    _AUTOMATON.make_automaton()
+except ImportError:  # fall back to the full regex scan
+    _AUTOMATON = None
+
+def _scan_min_price(text: str) -> float:
+    # Single pass with a running min — no intermediate list, and the
+    # 40..5000 sanity window (junk "1"s, absurd totals) is applied inline.
+    best = math.inf
+    if _AUTOMATON is not None:
+        # Linear C-speed token scan over the whole body; the amount regex
+        # only runs at the few offsets where a currency symbol appears,
+        # instead of the engine walking every character of megabyte HTML.
+        for end, _ in _AUTOMATON.iter(text):
+            m = _AMOUNT_RE.match(text, end + 1)
+            if m:
+                v = float(m.group(1).replace(",", ""))
+                if 40 < v < 5000 and v < best:
+                    best = v
+        return best
+    for m in _finditer(text):
+        v = float(m.group(1).replace(",", ""))
+        if 40 < v < 5000 and v < best:
+            best = v
+    return best
+
+# The tracker only needs text — skip the MBs of images/fonts/media and the
+# third-party trackers that vendor pages drag in.
+_BLOCKED_RESOURCE_TYPES = {"image", "media", "font", "stylesheet"}
+_BLOCKED_DOMAINS = ("google-analytics", "googletagmanager", "doubleclick", "hotjar")
+
+async def _block_heavy_requests(route):
+    req = route.request
+    if req.resource_type in _BLOCKED_RESOURCE_TYPES or any(d in req.url for d in _BLOCKED_DOMAINS):
+        await route.abort()
+    else:
+        await route.continue_()
+
+async def fetch_min_price_http(client, url: str) -> float | None:
+    # Fast path: a plain GET is ~100x cheaper than a browser render and works
+    # whenever the vendor server-renders prices into the HTML.
+    try:
+        resp = await client.get(url)
+        resp.raise_for_status()
+    except Exception as e:
+        print(f"[WARN] HTTP fast-path failed for {url}: {e}")
+        return None
+
+    best = _scan_min_price(resp.text)
+    return best if best != math.inf else None
+
+# Known price-element selectors per vendor. The specialized path is one
+# navigation plus one text_content() — no DOM walk, no regex scan over HTML.
+VENDOR_SELECTORS = {
+    "KLOOK": ".price__value, [data-price]",
+    "TRIPCOM": ".baseMoney, .priceNum",
+}
+
+async def fetch_specialized(page, vendor: str, url: str) -> float | None:
+    selector = VENDOR_SELECTORS.get(vendor)
+    if not selector:
+        return None
+    try:
+        await page.goto(url, wait_until="domcontentloaded", timeout=30000)
+        txt = await page.locator(selector).first.text_content(timeout=5000)
+        m = _AMOUNT_RE.search(txt or "")
+        if m:
+            v = float(m.group(1).replace(",", ""))
+            if 40 < v < 5000:
+                return v
+    except Exception:
+        pass  # vendor markup changed or timed out — generic scraper takes over
+    return None
 
 async def fetch_min_price(page, url: str) -> float | None:
+    from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
     try:
-        await page.goto(url, wait_until="networkidle", timeout=45000)
-        await page.wait_for_timeout(2000)  # give JS a moment to render
-
-        prices = []
-
-        # --- Pass 1: scrape visible text nodes likely containing prices
-        # Grab lots of candidate texts (buttons, spans, divs)
-        candidate_texts = await page.locator("text=/¥|AU\\$|A\\$|\\$/").all_text_contents()
-        for t in candidate_texts:
-            for m in PRICE_RE.finditer(t):
-                try:
-                    val = float(m.group(1).replace(",", ""))
-                    if val > 40:  # filter tiny junk like "1"
-                        prices.append(val)
-                except:
-                    pass
+        # domcontentloaded instead of networkidle: long-poll ads/analytics
+        # can keep the network busy forever. Then wait only until something
+        # price-shaped actually renders, instead of a blind fixed sleep.
+        # Navigation timeouts are usually transient, so retry with jittered
+        # backoff rather than losing the data point for the day.
+        for attempt in range(3):
+            try:
+                await page.goto(url, wait_until="domcontentloaded", timeout=30000)
+                break
+            except PlaywrightTimeoutError:
+                if attempt == 2:
+                    raise
+                await asyncio.sleep(2 ** attempt + random.random())
+        try:
+            await page.locator("text=/(¥|A?U?\\$|CNY)\\s*\\d/").first.wait_for(timeout=8000)
+        except PlaywrightTimeoutError:
+            pass  # fall through — the regex passes below still get a shot
 
-        # --- Pass 2: regex over full HTML as fallback
-        if not prices:
-            html = await page.content()
-            for m in PRICE_RE.finditer(html):
-                try:
-                    val = float(m.group(1).replace(",", ""))
-                    if val > 40:
-                        prices.append(val)
-                except:
-                    pass
+        # --- Pass 1: one in-browser DOM walk returning just the numbers.
+        # A locator over text nodes round-trips through CDP per match; this
+        # is a single evaluate regardless of page density.
+        dom_prices = await page.evaluate(
+            """() => {
+                const re = /(?:A\\$|AU\\$|\\$|¥|CNY)\\s*([1-9]\\d(?:,\\d{3})*|\\d{3,})/g;
+                const out = [];
+                for (const el of document.querySelectorAll('body *')) {
+                    const t = el.innerText;
+                    if (!t || t.length > 200) continue;
+                    let m;
+                    while ((m = re.exec(t))) out.push(parseFloat(m[1].replace(/,/g, '')));
+                }
+                return out;
+            }"""
+        )
+
+        best = math.inf
+        for v in dom_prices:
+            if 40 < v < 5000 and v < best:
+                best = v
 
-        # Heuristic guardrails: ticket prices won't be ridiculous.
-        prices = [p for p in prices if 10 < p < 5000]
+        # --- Pass 2: regex over full HTML as fallback
+        if best == math.inf:
+            best = _scan_min_price(await page.content())
 
-        return min(prices) if prices else None
+        return best if best != math.inf else None
 
     except Exception as e:
         print(f"[WARN] Failed to fetch {url}: {e}")
         return None
 
-async def main():
-    targets = []
-    for d in [x.strip() for x in DATES if x.strip()]:
-        klook = KLOOK_URL.format(DATE=d) if "{DATE}" in KLOOK_URL else KLOOK_URL
-        trip = TRIPCOM_URL.format(DATE=d) if TRIPCOM_URL else None
-        if klook:
-            targets.append(("KLOOK", d, klook))
-        if trip:
-            targets.append(("TRIPCOM", d, trip))
+# -------- WARM BROWSER POOL --------
+# Launching Chromium from cold costs hundreds of ms to seconds per run;
+# keep a singleton alive for the life of the daemon and only create fresh
+# contexts per scrape.
+_playwright = None
+_browser = None
+_browser_lock = asyncio.Lock()
 
-    results = []
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context(user_agent=USER_AGENT)
+# "New" headless with the unused subsystems (GPU, audio, sync, extensions,
+# background networking) switched off — less RAM per browser, faster cold
+# start, so CONCURRENCY can go higher on the same box.
+_LAUNCH_ARGS = [
+    "--headless=new",
+    "--disable-gpu",
+    "--disable-dev-shm-usage",
+    "--no-sandbox",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-sync",
+    "--mute-audio",
+    "--disable-translate",
+    "--blink-settings=imagesEnabled=false",
+]
+
+async def get_browser():
+    global _playwright, _browser
+    async with _browser_lock:
+        if _browser is None:
+            from playwright.async_api import async_playwright
+
+            _playwright = await async_playwright().start()
+            _browser = await _playwright.chromium.launch(headless=True, args=_LAUNCH_ARGS)
+        return _browser
+
+async def close_browser():
+    global _playwright, _browser
+    async with _browser_lock:
+        if _browser is not None:
+            try:
+                await _browser.close()
+            except Exception:
+                pass  # browser may already be dead — we're dropping it anyway
+            _browser = None
+        if _playwright is not None:
+            try:
+                await _playwright.stop()
+            except Exception:
+                pass
+            _playwright = None
+
+async def fetch_one(context, sem, vendor, date_str, url):
+    # One page per target inside a shared context: page creation is far
+    # cheaper than spinning up a whole context per scrape.
+    async with sem:
         page = await context.new_page()
-        for vendor, date_str, url in targets:
-            if not url:
-                continue
-            price = await fetch_min_price(page, url)
-            print(f"{vendor} {date_str} -> {price} ({url})")
+        try:
+            price = await fetch_specialized(page, vendor, url)
+            if price is None:
+                price = await fetch_min_price(page, url)
+        finally:
+            await page.close()
+        print(f"{vendor} {date_str} -> {price} ({url})")
+        return {"vendor": vendor, "date": date_str, "url": url, "minPrice": price}
+
+async def run_once():
+    # Try the cheap HTTP fast-path for every target first; only targets that
+    # yield no price fall back to the full browser.
+    results = []
+    fallback = []
+    async with httpx.AsyncClient(
+        headers={"User-Agent": USER_AGENT}, http2=True, timeout=30, follow_redirects=True
+    ) as client:
+        http_prices = await asyncio.gather(
+            *[fetch_min_price_http(client, url) for _, _, url in TARGETS],
+            return_exceptions=True,
+        )
+    for (vendor, date_str, url), price in zip(TARGETS, http_prices):
+        if isinstance(price, Exception) or price is None:
+            fallback.append((vendor, date_str, url))
+        else:
+            print(f"{vendor} {date_str} -> {price} ({url}) [http]")
             results.append({"vendor": vendor, "date": date_str, "url": url, "minPrice": price})
-        await browser.close()
+
+    if fallback:
+        sem = asyncio.Semaphore(CONCURRENCY)
+        browser = await get_browser()
+        context = await browser.new_context(user_agent=USER_AGENT)
+        await context.route("**/*", _block_heavy_requests)
+        try:
+            tasks = [
+                fetch_one(context, sem, vendor, date_str, url)
+                for vendor, date_str, url in fallback
+            ]
+            outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            await context.close()
+        for r in outcomes:
+            if isinstance(r, Exception):
+                print(f"[WARN] Fetch task failed: {r}")
+            else:
+                results.append(r)
 
     # Pick cheapest
     cheapest = None
@@ -99,35 +313,41 @@ async def main():
         if p is not None and (cheapest is None or p < cheapest["price"]):
             cheapest = {"price": p, "vendor": r["vendor"], "date": r["date"], "url": r["url"]}
 
-    # Load last best from history
+    # Load last best
     last_best = None
-    if HISTORY_PATH.exists():
+    if BEST_PATH.exists():
         try:
-            data = json.loads(HISTORY_PATH.read_text(encoding="utf-8"))
-            last_best = data.get("best")
+            last_best = _loads(BEST_PATH.read_bytes())
         except Exception as e:
-            print(f"[WARN] Failed reading history: {e}")
+            print(f"[WARN] Failed reading best: {e}")
+    else:
+        # One-time migration from the pre-JSONL layout: seed best.json from
+        # the old history.json so the first run doesn't re-alert on a price
+        # worse than the recorded all-time low.
+        legacy = BEST_PATH.with_name("history.json")
+        if legacy.exists():
+            try:
+                last_best = _loads(legacy.read_bytes()).get("best")
+                if last_best:
+                    save_best(last_best)
+            except Exception as e:
+                print(f"[WARN] Failed migrating legacy history: {e}")
 
     should_alert = False
     if cheapest and cheapest["price"] is not None:
         if not last_best or cheapest["price"] < last_best.get("price", 10**9):
             should_alert = True
 
-    # Save snapshot
-    HISTORY_PATH.parent.mkdir(parents=True, exist_ok=True)
+    # Append this run to the timeseries; rewrite best only when it changed.
     now_iso = datetime.now(timezone.utc).isoformat()
-    history = {"updated_at": now_iso, "latest": results, "best": last_best}
-    if cheapest:
-        if should_alert:
-            history["best"] = cheapest
-        else:
-            history["best"] = last_best
-    HISTORY_PATH.write_text(json.dumps(history, indent=2, ensure_ascii=False), encoding="utf-8")
+    append_history({"ts": now_iso, "results": results})
+    if should_alert and cheapest:
+        save_best(cheapest)
 
-    # Send emails if enabled
+    # Send emails if enabled — both over one SMTP connection.
     if EMAIL_ENABLED:
+        messages = []
         if should_alert and cheapest:
-            subject = "Shanghai Disneyland — New Cheapest Price"
             html = f"""
             <h3>New Cheapest Price Found</h3>
             <p><strong>Vendor:</strong> {cheapest['vendor']}<br/>
@@ -136,46 +356,130 @@ async def main():
             <strong>People:</strong> {PEOPLE_SUMMARY}<br/>
             <strong>Link:</strong> <a href="{cheapest['url']}">Open</a></p>
             """
-            safe_send_email(EMAIL_FROM, EMAIL_TO, subject, html)
+            messages.append(("Shanghai Disneyland — New Cheapest Price", html))
 
         # Daily snapshot
-        table_rows = "".join([
-            f"<tr><td>{r['vendor']}</td><td>{r['date']}</td><td>{r['minPrice'] or 'N/A'}</td><td><a href='{r['url']}'>open</a></td></tr>"
+        table_rows = "".join(
+            _ROW_TMPL.format(vendor=r["vendor"], date=r["date"], p=r["minPrice"] or "N/A", url=r["url"])
             for r in results
-        ])
+        )
         html = f"<h3>Daily Snapshot</h3><p>{PEOPLE_SUMMARY}</p><table border='1'><tr><th>Vendor</th><th>Date</th><th>Min Price</th><th>Link</th></tr>{table_rows}</table>"
-        safe_send_email(EMAIL_FROM, EMAIL_TO, "Shanghai Disneyland — Daily Snapshot", html)
+        messages.append(("Shanghai Disneyland — Daily Snapshot", html))
+
+        await safe_send_emails(messages)
     else:
         print("[INFO] EMAIL_ENABLED=false — skipping emails.")
 
-def safe_send_email(email_from, email_to, subject, html):
+_ROW_TMPL = "<tr><td>{vendor}</td><td>{date}</td><td>{p}</td><td><a href='{url}'>open</a></td></tr>"
+
+# MIME skeleton reused across sends — only the headers and payload change.
+_msg_skeleton = None
+
+def _build_message(email_from, email_to, subject, html):
+    from email.mime.text import MIMEText
+    from email.mime.multipart import MIMEMultipart
+
+    global _msg_skeleton
+    if _msg_skeleton is None:
+        _msg_skeleton = MIMEMultipart("alternative")
+        _msg_skeleton["From"] = email_from
+        _msg_skeleton["To"] = email_to
+        _msg_skeleton["Subject"] = subject
+    else:
+        _msg_skeleton.replace_header("From", email_from)
+        _msg_skeleton.replace_header("To", email_to)
+        _msg_skeleton.replace_header("Subject", subject)
+    _msg_skeleton.set_payload([MIMEText(html, "html", "utf-8")])
+    return _msg_skeleton
+
+def append_history(record):
+    # Append-only timeseries: O(one line) per run no matter how long the
+    # history grows, and readers can `tail` it cheaply.
+    HISTORY_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with HISTORY_PATH.open("ab") as f:
+        f.write(_dumps(record) + b"\n")
+
+def save_best(best):
+    # Write-then-rename so a crash mid-write can never leave a torn file.
+    BEST_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = BEST_PATH.with_suffix(".tmp")
+    tmp.write_bytes(_dumps(best))
+    os.replace(tmp, BEST_PATH)
+
+async def safe_send_emails(messages):
+    # Fault-tolerant wrapper: a broken SMTP server must not kill the run.
     try:
-        send_email(email_from, email_to, subject, html)
+        server = await open_smtp()
+        try:
+            # Sends stay sequential — SMTP is one command at a time per
+            # connection — but awaiting them no longer blocks the loop.
+            for subject, html in messages:
+                await send_via(server, EMAIL_FROM, EMAIL_TO, subject, html)
+        finally:
+            await server.quit()
     except Exception as e:
         print(f"[WARN] Email send failed but continuing: {e}")
 
-def send_email(email_from, email_to, subject, html):
-    msg = MIMEMultipart("alternative")
-    msg["From"] = email_from
-    msg["To"] = email_to
-    msg["Subject"] = subject
-    part = MIMEText(html, "html", "utf-8")
-    msg.attach(part)
-
-    if SMTP_SECURE == "SSL":
-        context = ssl.create_default_context()
-        with smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, context=context) as server:
-            if SMTP_USER and SMTP_PASS:
-                server.login(SMTP_USER, SMTP_PASS)
-            server.sendmail(email_from, [email_to], msg.as_string())
-    else:
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=60) as server:
-            if SMTP_SECURE == "TLS":
-                server.starttls(context=ssl.create_default_context())
-            if SMTP_USER and SMTP_PASS:
-                server.login(SMTP_USER, SMTP_PASS)
-            server.sendmail(email_from, [email_to], msg.as_string())
+async def open_smtp():
+    import aiosmtplib
+
+    # One connection (TCP + TLS handshake + AUTH) shared across all sends.
+    server = aiosmtplib.SMTP(
+        hostname=SMTP_HOST,
+        port=SMTP_PORT,
+        timeout=60,
+        start_tls=(SMTP_SECURE == "TLS"),
+        use_tls=(SMTP_SECURE == "SSL"),
+    )
+    await server.connect()
+    if SMTP_USER and SMTP_PASS:
+        await server.login(SMTP_USER, SMTP_PASS)
+    return server
+
+async def send_via(server, email_from, email_to, subject, html):
+    msg = _build_message(email_from, email_to, subject, html)
+    await server.send_message(msg)
     print(f"[INFO] Email sent to {email_to}: {subject}")
 
+async def single_run():
+    # One-shot mode for cron/GitHub Actions: scrape once and exit instead
+    # of staying resident.
+    try:
+        await run_once()
+    finally:
+        await close_browser()
+
+async def scheduler():
+    # Long-lived loop: scrape, sleep, repeat — the browser stays warm across
+    # runs and is only torn down on SIGINT/SIGTERM.
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass  # e.g. Windows
+    try:
+        while not stop.is_set():
+            try:
+                await run_once()
+            except Exception as e:
+                # A dead daemon is worse than the cron model it replaced:
+                # log, drop the (possibly crashed) browser so the next tick
+                # relaunches it, and keep ticking.
+                print(f"[WARN] Run failed, retrying next tick: {e}")
+                await close_browser()
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=RUN_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        await close_browser()
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        import uvloop
+        uvloop.install()  # faster I/O dispatch for the many small CDP messages
+    except ImportError:
+        pass  # default asyncio loop works fine, just slower
+    asyncio.run(single_run() if RUN_ONCE else scheduler())